@@ -46,6 +46,8 @@ DEFAULT_SOLID_THRES = 0.60 # Percentage for black/white detection
 DEFAULT_OBJ_PROMPT = "Analyze the image and determine with at least 70% confidence whether it contains man-made objects (buildings, houses, light poles, cars, sheds, or artificial structures) that affect depth; exclude natural elements like trees or paths in mostly tree-covered images, and explicitly state 'True' or 'False' before listing identified objects or explaining uncertainty."
 DEFAULT_BLACK_THRES = 30 # Pixel value for black in BW check
 DEFAULT_WHITE_THRES = 225 # Pixel value for white in BW check
+DEFAULT_LLM_STRIDE = 10 # Max frames per object detection LLM call
+DEFAULT_FRAME_DEDUPE_THRES = 2.0 # Mean abs pixel difference below which a frame reuses the previous verdict
 
 # Store session data
 sessions: Dict[str, dict] = {}
@@ -84,6 +86,8 @@ async def create_session():
             'Object Detection Prompt': DEFAULT_OBJ_PROMPT,
             'Black Threshold BW': DEFAULT_BLACK_THRES,
             'White Threshold BW': DEFAULT_WHITE_THRES,
+            'LLM Stride': DEFAULT_LLM_STRIDE,
+            'Frame Dedupe Threshold': DEFAULT_FRAME_DEDUPE_THRES,
         },
         'pipeline_processes': {
             'Pattern Thresholding': True,
@@ -614,6 +618,8 @@ async def restore_defaults_endpoint(data: dict):
         'Object Detection Prompt': DEFAULT_OBJ_PROMPT,
         'Black Threshold BW': DEFAULT_BLACK_THRES,
         'White Threshold BW': DEFAULT_WHITE_THRES,
+        'LLM Stride': DEFAULT_LLM_STRIDE,
+        'Frame Dedupe Threshold': DEFAULT_FRAME_DEDUPE_THRES,
     }
     sessions[session_id]['pipeline_processes'] = {
         'Pattern Thresholding': True, 'Model Object Detection': True, 'Solid Color Detection': True
@@ -8,41 +8,162 @@ import io
 import shutil
 import time
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError: # Optional: falls back to the cv2.calcHist path below
+    HAS_NUMBA = False
+
+try:
+    import faiss
+    HAS_FAISS = True
+except ImportError: # Optional: falls back to per-pattern matching on _match_pool
+    HAS_FAISS = False
+
 logger = logging.getLogger(__name__)
 
-def is_mostly_black_or_white(image_cv, black_threshold_val=30, white_threshold_val=225, percentage_threshold=0.60):
+try:
+    from turbojpeg import TurboJPEG
+    _jpeg = TurboJPEG()
+    logger.info("Encoding LLM frames with TurboJPEG.")
+except Exception as e: # Optional: needs the libjpeg-turbo shared library (RuntimeError when it can't be located)
+    _jpeg = None
+    logger.info(f"TurboJPEG unavailable ({e}); encoding LLM frames with cv2.imencode.")
+
+# Make sure OpenCV's runtime-dispatched SIMD paths (AVX2/AVX-512 SIFT etc.) are enabled, and leave
+# half the cores for our own thread pools so OpenCV's internal threads don't oversubscribe the CPU
+cv2.setUseOptimized(True)
+cv2.setNumThreads(max(1, (os.cpu_count() or 2) // 2))
+_cpu_features_logged = False
+
+# Pattern features are computed on the GPU when OpenCV was built with CUDA and a device is present.
+# OpenCV has no CUDA SIFT, so the GPU path uses ORB binary descriptors with a Hamming matcher instead;
+# only the best-matching pattern matters, so ORB's lower discriminability is acceptable there.
+try:
+    USE_CUDA = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    USE_CUDA = False
+
+# Created once and reused for every frame instead of being rebuilt per call
+sift = cv2.SIFT_create()
+orb_gpu = cv2.cuda.ORB_create(nfeatures=1000) if USE_CUDA else None
+ORB_HAMMING_THRESH = 64 # Hamming distance cutoff for a "good" ORB match (of 256 bits); replaces the SIFT distance on the GPU path
+# KD-tree FLANN settings for the per-pattern matchers on the CPU path (algorithm=1 is FLANN_INDEX_KDTREE)
+FLANN_INDEX_PARAMS = dict(algorithm=1, trees=5)
+FLANN_SEARCH_PARAMS = dict(checks=32)
+# HNSW graph settings for the combined FAISS pattern index (8-bit scalar-quantized vectors); exact
+# search over tens of thousands of pattern descriptors is slower per frame than FLANN on a typical CPU
+PATTERN_INDEX_HNSW_M = 16
+PATTERN_INDEX_EF_SEARCH = 16
+PATTERN_INDEX_NEIGHBOURS = 8 # Neighbours searched per frame descriptor, to find its nearest descriptor in each pattern
+
+# Patterns are matched in parallel; matchers keep internal state, so each worker thread gets its own
+_match_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+_matcher_local = threading.local()
+
+# Accepted frames are written as JPEG on background threads so encoding/IO overlaps with processing
+JPEG_WRITE_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 92]
+MAX_PENDING_WRITES = 64 # Bounds how many frames can be held in memory waiting to be written
+_io_pool = ThreadPoolExecutor(max_workers=4)
+
+# Already-compressed images are stored as-is in the results ZIP; deflating them only costs CPU
+PRECOMPRESSED_SUFFIXES = {'.jpg', '.jpeg', '.png'}
+ZIP_COPY_CHUNK_SIZE = 1 << 20 # Bytes copied per read when streaming files into the ZIP
+REMOVED_IMAGES_LOG_NAME = "removed_images_log.txt"
+
+# Frames this close (mean abs gray-level difference of 32x32 thumbnails) to the last analysed
+# frame reuse its verdict instead of running every stage again
+FRAME_THUMBNAIL_SIZE = (32, 32)
+
+# Each video is decoded on its own thread into a bounded queue so decoding overlaps with processing
+FRAME_QUEUE_SIZE = 16
+
+# Sparse optical flow used to reuse LLM verdicts between strided calls. The scene counts as changed once
+# fewer than FLOW_MIN_TRACKED_FRACTION of the corners are still tracked, once the median corner has moved
+# more than FLOW_MAX_SHIFT_FRACTION of the frame width since the verdict, or once any cell of a coarse grid
+# differs from the motion-compensated verdict frame by more than FLOW_MAX_CELL_DIFF (something entered the view)
+FLOW_MAX_CORNERS = 200
+FLOW_MIN_TRACKED_FRACTION = 0.5
+FLOW_MAX_SHIFT_FRACTION = 0.05
+FLOW_CHANGE_GRID = (8, 8)
+FLOW_MAX_CELL_DIFF = 20.0 # Mean gray levels per cell
+
+if HAS_NUMBA:
+    @njit(parallel=True, cache=True)
+    def _bw_counts(gray, black_thresh, white_thresh):
+        """Counts black and white pixels of a grayscale image in one parallel scan."""
+        black = 0
+        white = 0
+        for y in prange(gray.shape[0]):
+            for x in range(gray.shape[1]):
+                v = gray[y, x]
+                if v <= black_thresh:
+                    black += 1
+                if v >= white_thresh:
+                    white += 1
+        return black, white
+
+def is_mostly_black_or_white(gray_image, black_threshold_val=30, white_threshold_val=225, percentage_threshold=0.60):
     """
     Check if an image is mostly black or white.
     Args:
-        image_cv (numpy.ndarray): Image data from cv2.imread or a frame.
+        gray_image (numpy.ndarray): Grayscale image data (converted once per frame by the caller).
         black_threshold_val (int): Pixel intensity below this is considered black.
         white_threshold_val (int): Pixel intensity above this is considered white.
         percentage_threshold (float): Threshold for black or white percentage.
     Returns:
         bool: True if the image is mostly black or white, False otherwise.
     """
-    if image_cv is None:
+    if gray_image is None:
         logger.error("is_mostly_black_or_white: Input image is None.")
         return False # Or raise error
 
-    gray_image = image_cv
-    if len(image_cv.shape) == 3:
-        gray_image = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
-
     total_pixels = gray_image.size
     if total_pixels == 0:
         logger.error("is_mostly_black_or_white: Image has zero pixels.")
         return False
+    threshold_pixels = percentage_threshold * total_pixels
+
+    if HAS_NUMBA:
+        black_pixels, white_pixels = _bw_counts(gray_image, int(black_threshold_val), int(np.ceil(white_threshold_val)))
+        return black_pixels >= threshold_pixels or white_pixels >= threshold_pixels
+
+    # One histogram pass gives both counts without allocating boolean masks. The bin bounds are clamped
+    # to 0..256 since the thresholds come straight from the session and negative ones would index from the end
+    hist = cv2.calcHist([gray_image], [0], None, [256], [0, 256]).ravel()
+
+    black_pixels = hist[:min(max(int(black_threshold_val) + 1, 0), 256)].sum()
+    if black_pixels >= threshold_pixels:
+        return True
+    white_pixels = hist[min(max(int(np.ceil(white_threshold_val)), 0), 256):].sum()
+    return white_pixels >= threshold_pixels
+
+def _query_model(frame_cv, model_prompt_content):
+    """Asks the Ollama model about one frame. Returns the same tuple as modelObjectDetection; raises on any model error."""
+    if _jpeg is not None:
+        image_bytes = _jpeg.encode(frame_cv, quality=85)
+    else:
+        _, buffer = cv2.imencode('.jpg', frame_cv)
+        image_bytes = buffer.tobytes()
 
-    black_pixels = np.sum(gray_image <= black_threshold_val)
-    white_pixels = np.sum(gray_image >= white_threshold_val)
-
-    black_percentage = black_pixels / total_pixels
-    white_percentage = white_pixels / total_pixels
-
-    return black_percentage >= percentage_threshold or white_percentage >= percentage_threshold
+    res = ollama.chat(
+        model="llava:34b", # Ensure this model is available
+        messages=[
+            {
+                'role': 'user',
+                'content': model_prompt_content,
+                'images': [image_bytes]
+            }
+        ]
+    )
+    model_response_content = res['message']['content']
+    objects_detected = not re.search(r'False', model_response_content, re.IGNORECASE) # More robust check
+    return objects_detected, model_response_content
 
 def modelObjectDetection(frame_cv, model_prompt_content):
     """
@@ -57,96 +178,276 @@ def modelObjectDetection(frame_cv, model_prompt_content):
         logger.error("modelObjectDetection: Input frame is None.")
         return True, "Error: Input frame was None." # Default to objects_detected = True to avoid filtering good images due to error
 
-    objects_detected = True  # Default assumption
-    model_response_content = "Error in model processing."
-
     try:
-        _, buffer = cv2.imencode('.jpg', frame_cv)
-        image_bytes = buffer.tobytes()
-
-        res = ollama.chat(
-            model="llava:34b", # Ensure this model is available
-            messages=[
-                {
-                    'role': 'user',
-                    'content': model_prompt_content,
-                    'images': [image_bytes]
-                }
-            ]
-        )
-        model_response_content = res['message']['content']
-        if re.search(r'False', model_response_content, re.IGNORECASE): # More robust check
-            objects_detected = False
+        return _query_model(frame_cv, model_prompt_content)
     except Exception as e:
         logger.error(f"Error in modelObjectDetection with Ollama: {e}")
         # Keep objects_detected = True to be safe, or handle error differently
-    return objects_detected, model_response_content
+        return True, "Error in model processing."
+
+def _tracked_model_query(frame_cv, model_prompt_content, tracker_state):
+    """Asks the model for trackedObjectDetection; on an error returns the safe default and marks the state as failed."""
+    try:
+        return _query_model(frame_cv, model_prompt_content)
+    except Exception as e:
+        logger.error(f"Error in trackedObjectDetection with Ollama: {e}")
+        tracker_state['model_failed'] = True
+        tracker_state['reuses_left'] = 0
+        return True, "Error in model processing." # Same safe default as modelObjectDetection
 
+def _scene_unchanged(verdict_gray, origin_points, frame_gray, tracked_points):
+    """
+    Checks that a frame still shows the scene the last LLM verdict was made on: the tracked corners
+    (`origin_points` in the verdict frame, `tracked_points` now) haven't moved far, and after warping the
+    verdict frame by their motion no grid cell differs much from the frame.
+    """
+    shift = np.median(np.linalg.norm((tracked_points - origin_points).reshape(-1, 2), axis=1))
+    if shift > FLOW_MAX_SHIFT_FRACTION * frame_gray.shape[1]:
+        return False
+    transform, _ = cv2.estimateAffinePartial2D(origin_points, tracked_points)
+    if transform is None:
+        return False
+    warped = cv2.warpAffine(verdict_gray, transform, (frame_gray.shape[1], frame_gray.shape[0]), borderMode=cv2.BORDER_REPLICATE)
+    # INTER_AREA down to the grid size gives the mean gray level of each cell
+    warped_cells = cv2.resize(warped, FLOW_CHANGE_GRID, interpolation=cv2.INTER_AREA).astype(np.float32)
+    frame_cells = cv2.resize(frame_gray, FLOW_CHANGE_GRID, interpolation=cv2.INTER_AREA).astype(np.float32)
+    return float(np.abs(warped_cells - frame_cells).max()) <= FLOW_MAX_CELL_DIFF
 
-def patternThresholding(test_image_cv, loaded_pattern_images_data, threshold_match_val):
+def trackedObjectDetection(frame_cv, model_prompt_content, tracker_state, llm_stride):
     """
-    Compare an image against multiple patterns using SIFT features.
+    Run modelObjectDetection at most every `llm_stride` frames, reusing the last verdict
+    in between while sparse optical flow shows the scene has not changed (see _scene_unchanged).
+    A failed model call is never reused, so the next frame asks the model again; it also sets
+    tracker_state['model_failed'] so callers know not to reuse this frame's verdict either.
     Args:
-        test_image_cv (numpy.ndarray): Grayscale image to be matched.
-        loaded_pattern_images_data (list): List of tuples (pattern_cv_gray, pattern_name).
+        frame_cv (numpy.ndarray): Image data (frame).
+        model_prompt_content (str): The prompt for the LLM.
+        tracker_state (dict): Per-job state carried between calls; start with an empty dict.
+        llm_stride (int): Max frames per LLM call. 1 or less calls the LLM on every frame.
+    Returns:
+        tuple: Same as modelObjectDetection.
+    """
+    tracker_state['model_failed'] = False
+    if frame_cv is None:
+        return modelObjectDetection(frame_cv, model_prompt_content)
+    if llm_stride <= 1:
+        return _tracked_model_query(frame_cv, model_prompt_content, tracker_state)
+
+    frame_gray = frame_cv
+    if len(frame_cv.shape) == 3:
+        frame_gray = cv2.cvtColor(frame_cv, cv2.COLOR_BGR2GRAY)
+
+    prev_points = tracker_state.get('points')
+    if tracker_state.get('reuses_left', 0) > 0 and prev_points is not None and len(prev_points) > 0:
+        try:
+            next_points, status, _ = cv2.calcOpticalFlowPyrLK(tracker_state['gray'], frame_gray, prev_points, None)
+            tracked = status.ravel() == 1
+            tracked_points = next_points[tracked].reshape(-1, 1, 2)
+            origin_points = tracker_state['origin_points'][tracked]
+            if (len(tracked_points) >= FLOW_MIN_TRACKED_FRACTION * tracker_state['initial_corners']
+                    and _scene_unchanged(tracker_state['verdict_gray'], origin_points, frame_gray, tracked_points)):
+                tracker_state['gray'] = frame_gray
+                tracker_state['points'] = tracked_points
+                tracker_state['origin_points'] = origin_points
+                tracker_state['reuses_left'] -= 1
+                return tracker_state['verdict']
+        except cv2.error as e:
+            logger.warning(f"Optical flow failed, falling back to the model: {e}")
+
+    verdict = _tracked_model_query(frame_cv, model_prompt_content, tracker_state)
+    if tracker_state['model_failed']:
+        return verdict
+    corners = cv2.goodFeaturesToTrack(frame_gray, FLOW_MAX_CORNERS, 0.01, 10)
+    tracker_state.update({
+        'gray': frame_gray,
+        'verdict_gray': frame_gray,
+        'points': corners,
+        'origin_points': corners,
+        'initial_corners': 0 if corners is None else len(corners),
+        'reuses_left': llm_stride - 1,
+        'verdict': verdict,
+    })
+    return verdict
+
+
+def extract_descriptors(gray_image):
+    """
+    Detects keypoints and computes descriptors for a grayscale image.
+    With USE_CUDA this is ORB on the GPU and the descriptors stay on the device as a cv2.cuda_GpuMat;
+    otherwise it is SIFT on the CPU. Returns None when no keypoints are found.
+    """
+    if USE_CUDA:
+        gray_gpu = cv2.cuda_GpuMat()
+        gray_gpu.upload(gray_image)
+        _, descriptors_gpu = orb_gpu.detectAndComputeAsync(gray_gpu, None)
+        return None if descriptors_gpu.empty() else descriptors_gpu
+    _, descriptors = sift.detectAndCompute(gray_image, None)
+    if descriptors is None or len(descriptors) == 0:
+        return None
+    return descriptors
+
+def _get_matcher():
+    """Returns this thread's descriptor matcher, creating it on first use."""
+    matcher = getattr(_matcher_local, 'matcher', None)
+    if matcher is None:
+        if USE_CUDA:
+            matcher = cv2.cuda.DescriptorMatcher_createBFMatcher(cv2.NORM_HAMMING)
+        else:
+            matcher = cv2.FlannBasedMatcher(FLANN_INDEX_PARAMS, FLANN_SEARCH_PARAMS)
+        _matcher_local.matcher = matcher
+    return matcher
+
+def _count_mutual_matches(test_descriptors, pattern_descriptors, nearest, distances, threshold_match_val):
+    """
+    Counts the good matches between a frame and one pattern the way BFMatcher(crossCheck=True) does:
+    a frame descriptor counts when its nearest pattern descriptor is closer than `threshold_match_val`
+    and has that frame descriptor as its own nearest neighbour in the frame.
+    Args:
+        nearest (numpy.ndarray): Index of each frame descriptor's nearest pattern descriptor, -1 if none.
+        distances (numpy.ndarray): L2 distance to that pattern descriptor.
+    """
+    candidates = np.flatnonzero((nearest >= 0) & (distances < threshold_match_val))
+    if len(candidates) == 0:
+        return 0
+    # Only the few candidates under the threshold need the reverse check, so it is done exactly
+    backward_matches = cv2.BFMatcher(cv2.NORM_L2).match(pattern_descriptors[nearest[candidates]], test_descriptors)
+    reverse_nearest = np.full(len(candidates), -1)
+    for m in backward_matches:
+        reverse_nearest[m.queryIdx] = m.trainIdx
+    return int(np.count_nonzero(reverse_nearest == candidates))
+
+def _match_one(test_descriptors, pattern_descriptors, pattern_name, threshold_match_val, matcher=None):
+    """
+    Counts the good matches between a frame and one pattern; runs on the _match_pool threads.
+    `matcher` is the pattern's trained FLANN matcher from build_pattern_index, when there is one.
+    """
+    try:
+        if USE_CUDA:
+            # Both directions on the GPU, then the same mutual nearest neighbour rule as the CPU path
+            gpu_matcher = _get_matcher()
+            forward_matches = gpu_matcher.match(test_descriptors, pattern_descriptors)
+            reverse_nearest = {m.queryIdx: m.trainIdx for m in gpu_matcher.match(pattern_descriptors, test_descriptors)}
+            good_matches = [m for m in forward_matches
+                            if m.distance < threshold_match_val and reverse_nearest.get(m.trainIdx) == m.queryIdx]
+            return pattern_name, len(good_matches)
+
+        if matcher is not None:
+            forward_matches = matcher.match(test_descriptors)
+        else:
+            forward_matches = _get_matcher().match(test_descriptors, pattern_descriptors)
+        nearest = np.full(len(test_descriptors), -1)
+        distances = np.full(len(test_descriptors), np.inf, dtype=np.float32)
+        for m in forward_matches:
+            nearest[m.queryIdx] = m.trainIdx
+            distances[m.queryIdx] = m.distance
+        return pattern_name, _count_mutual_matches(test_descriptors, pattern_descriptors, nearest, distances, threshold_match_val)
+    except cv2.error as e:
+        logger.error(f"Error during descriptor matching for pattern {pattern_name}: {e}")
+        return pattern_name, 0
+
+def build_pattern_index(loaded_pattern_descriptors):
+    """
+    Builds the per-job search structures for matching frames against every pattern on the CPU. With FAISS installed
+    this is one approximate (HNSW, 8-bit quantized) L2 index over the SIFT descriptors of all patterns, so each frame
+    needs a single search; otherwise it is one trained KD-tree FLANN matcher per pattern, so the trees aren't rebuilt per frame.
+    Returns: dict with 'pattern_descriptors', 'pattern_names' and either 'index', 'pattern_ids' (pattern position of
+    each indexed descriptor) and 'pattern_offsets' (position of each pattern's first descriptor), or 'matchers';
+    None when the GPU ORB path is active or no patterns are loaded.
+    """
+    if USE_CUDA or not loaded_pattern_descriptors:
+        return None
+    pattern_index = {
+        'pattern_descriptors': [descriptors for descriptors, _ in loaded_pattern_descriptors],
+        'pattern_names': [pattern_name for _, pattern_name in loaded_pattern_descriptors],
+    }
+    if not HAS_FAISS:
+        matchers = []
+        for descriptors in pattern_index['pattern_descriptors']:
+            matcher = cv2.FlannBasedMatcher(FLANN_INDEX_PARAMS, FLANN_SEARCH_PARAMS)
+            matcher.add([descriptors])
+            matcher.train()
+            matchers.append(matcher)
+        pattern_index['matchers'] = matchers
+        return pattern_index
+
+    all_descriptors = np.vstack(pattern_index['pattern_descriptors']).astype(np.float32)
+    pattern_sizes = [len(descriptors) for descriptors in pattern_index['pattern_descriptors']]
+    # 8-bit scalar quantization stores each descriptor in 128 bytes instead of 512, cutting the memory
+    # traffic of distance computations; training only learns the per-dimension value ranges
+    index = faiss.IndexHNSWSQ(all_descriptors.shape[1], faiss.ScalarQuantizer.QT_8bit, PATTERN_INDEX_HNSW_M)
+    index.train(all_descriptors)
+    index.hnsw.efSearch = PATTERN_INDEX_EF_SEARCH
+    index.add(all_descriptors)
+    pattern_index.update({
+        'index': index,
+        'pattern_ids': np.repeat(np.arange(len(pattern_sizes)), pattern_sizes),
+        'pattern_offsets': np.cumsum([0] + pattern_sizes[:-1]),
+    })
+    return pattern_index
+
+def _match_with_index(test_descriptors, pattern_index, threshold_match_val):
+    """
+    Counts the good matches of a frame against every pattern from one search of the combined FAISS index,
+    using the same mutual nearest neighbour rule as _match_one.
+    Returns: (pattern_name, number_of_good_matches) for the pattern with the most good matches.
+    """
+    distances, neighbours = pattern_index['index'].search(np.ascontiguousarray(test_descriptors, dtype=np.float32),
+                                                          PATTERN_INDEX_NEIGHBOURS)
+    neighbour_patterns = np.where(neighbours >= 0, pattern_index['pattern_ids'][neighbours], -1)
+    rows = np.arange(len(distances))
+    good_counts = []
+    for pattern_id, pattern_descriptors in enumerate(pattern_index['pattern_descriptors']):
+        # Nearest neighbour from this pattern among the k results; frame descriptors without one have no match there
+        in_pattern = neighbour_patterns == pattern_id
+        first = in_pattern.argmax(axis=1)
+        nearest = np.where(in_pattern[rows, first], neighbours[rows, first] - pattern_index['pattern_offsets'][pattern_id], -1)
+        # FAISS L2 indexes report squared distances
+        good_counts.append(_count_mutual_matches(test_descriptors, pattern_descriptors, nearest,
+                                                 np.sqrt(distances[rows, first]), threshold_match_val))
+    best = int(np.argmax(good_counts)) # argmax keeps the first pattern on ties
+    return pattern_index['pattern_names'][best], good_counts[best]
+
+def patternThresholding(test_img_gray, loaded_pattern_descriptors, threshold_match_val, pattern_index=None):
+    """
+    Compare an image against multiple patterns using SIFT features (ORB on the GPU, see extract_descriptors).
+    Args:
+        test_img_gray (numpy.ndarray): Grayscale image to be matched.
+        loaded_pattern_descriptors (list): List of tuples (pattern_descriptors, pattern_name),
+            with descriptors precomputed once per job in process_video_frames by extract_descriptors.
         threshold_match_val (int): SIFT match distance threshold (lower is stricter, but it's used differently here).
+            Not used on the GPU path, where ORB_HAMMING_THRESH applies instead.
+        pattern_index (dict): Optional search structures from build_pattern_index; with a combined FAISS index every
+            pattern is scored from one search, otherwise each pattern is matched with its trained matcher.
     Returns:
         str: Name of the best matching pattern or None.
     """
-    if test_image_cv is None:
+    if test_img_gray is None:
         logger.error("patternThresholding: Input test_image is None.")
         return None
-    
-    test_img_gray = test_image_cv
-    if len(test_image_cv.shape) == 3:
-         test_img_gray = cv2.cvtColor(test_image_cv, cv2.COLOR_BGR2GRAY)
-
 
-    sift = cv2.SIFT_create()
     try:
-        test_keypoints, test_descriptors = sift.detectAndCompute(test_img_gray, None)
+        test_descriptors = extract_descriptors(test_img_gray)
     except cv2.error as e:
-        logger.error(f"SIFT error on test image: {e}")
+        logger.error(f"Feature extraction error on test image: {e}")
         return None
 
-
-    if test_descriptors is None or test_keypoints is None or len(test_keypoints) == 0 :
-        logger.warning("No SIFT descriptors found for test image.")
+    if test_descriptors is None:
+        logger.warning("No descriptors found for test image.")
         return None
 
-    bf = cv2.BFMatcher(cv2.NORM_L2, crossCheck=True)
-    best_match_name = None
-    max_good_matches = 0 # want the pattern with the most "good" matches
-
-    for pattern_img_gray, pattern_name in loaded_pattern_images_data:
-        if pattern_img_gray is None:
-            logger.warning(f"Skipping None pattern image: {pattern_name}")
-            continue
-        try:
-            pattern_keypoints, pattern_descriptors = sift.detectAndCompute(pattern_img_gray, None)
-        except cv2.error as e:
-            logger.error(f"SIFT error on pattern image {pattern_name}: {e}")
-            continue
-
-
-        if pattern_descriptors is None or pattern_keypoints is None or len(pattern_keypoints) == 0:
-            logger.warning(f"No SIFT descriptors found for pattern: {pattern_name}")
-            continue
+    distance_thresh = ORB_HAMMING_THRESH if USE_CUDA else threshold_match_val
+    if pattern_index is not None and 'index' in pattern_index:
+        best_match_name, max_good_matches = _match_with_index(test_descriptors, pattern_index, distance_thresh)
+    else:
+        matchers = pattern_index['matchers'] if pattern_index is not None else [None] * len(loaded_pattern_descriptors)
+        # Each pattern's matcher is only used by one task at a time, so the pool can share them
+        results = list(_match_pool.map(
+            lambda pattern, matcher: _match_one(test_descriptors, pattern[0], pattern[1], distance_thresh, matcher),
+            loaded_pattern_descriptors, matchers
+        ))
+        # want the pattern with the most "good" matches; max() keeps the first one on ties
+        best_match_name, max_good_matches = max(results, key=lambda r: r[1], default=(None, 0))
 
-        try:
-            matches = bf.match(test_descriptors, pattern_descriptors)
-            matches = sorted(matches, key=lambda x: x.distance)
-            # `threshold_match_val` is the distance cutoff for a match to be "good"
-            good_matches = [m for m in matches if m.distance < threshold_match_val]
-            num_good_matches = len(good_matches)
-
-            if num_good_matches > max_good_matches:
-                max_good_matches = num_good_matches
-                best_match_name = pattern_name
-        except cv2.error as e:
-            logger.error(f"Error during SIFT matching for pattern {pattern_name}: {e}")
-            continue
-            
     # what's a "match"? is it if any pattern has at least X good_matches?
     # `THRESHOLD_PATTERN_MATCH` is distance threshold
     # assume `max_good_matches > 1` is good enough
@@ -154,48 +455,153 @@ def patternThresholding(test_image_cv, loaded_pattern_images_data, threshold_mat
     return best_match_name if max_good_matches > 1 else "No_Pattern_Match"
 
 
-def sort_into_folders(output_base_dir, name_folder, raw_image_cv, raw_image_name, realsense_image_cv, realsense_image_name):
-    """Sorts images into named subfolders under the output base directory."""
-    target_dir_raw = Path(output_base_dir) / name_folder / "raw"
-    target_dir_realsense = Path(output_base_dir) / name_folder / "realsense"
-
-    target_dir_raw.mkdir(parents=True, exist_ok=True)
-    target_dir_realsense.mkdir(parents=True, exist_ok=True)
-
-    cv2.imwrite(str(target_dir_raw / raw_image_name), raw_image_cv)
-    cv2.imwrite(str(target_dir_realsense / realsense_image_name), realsense_image_cv)
+def frame_thumbnail(gray_image):
+    """Shrinks a grayscale frame to FRAME_THUMBNAIL_SIZE for the cheap frame-to-frame comparisons."""
+    return cv2.resize(gray_image, FRAME_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+
+def thumbnail_difference(thumbnail_a, thumbnail_b):
+    """Mean absolute gray-level difference between two thumbnails from frame_thumbnail."""
+    return float(np.mean(cv2.absdiff(thumbnail_a, thumbnail_b)))
+
+def log_opencv_cpu_features():
+    """Logs OpenCV's CPU baseline/dispatch build info once per process."""
+    global _cpu_features_logged
+    if _cpu_features_logged:
+        return
+    _cpu_features_logged = True
+    build_info = cv2.getBuildInformation()
+    start = build_info.find("CPU/HW features:")
+    if start == -1:
+        logger.info(f"OpenCV {cv2.__version__}: CPU feature info not available in build information.")
+        return
+    feature_lines = [" ".join(line.split()) for line in build_info[start:].splitlines()
+                     if "Baseline:" in line or "Dispatched code generation:" in line]
+    logger.info(f"OpenCV {cv2.__version__} (optimized: {cv2.useOptimized()}, threads: {cv2.getNumThreads()}): "
+                f"{'; '.join(feature_lines[:2])}")
+
+def _write_image(path, image_cv):
+    """Writes one image with the JPEG params; runs on the _io_pool threads. Returns the path, or None on failure."""
+    if not cv2.imwrite(path, image_cv, JPEG_WRITE_PARAMS):
+        logger.error(f"Failed to write image: {path}")
+        return None
+    return path
 
-def create_text_file_with_removed_images(output_base_dir, removed_images_log):
-    """Creates a log file for removed images."""
-    log_path = Path(output_base_dir) / "removed_images_log.txt"
-    with open(log_path, "w") as f:
-        f.write("Log of images removed or not fitting criteria:\n")
-        for file_name, reason in removed_images_log:
-            f.write(f"Frame/Image name: {file_name}, Reason: {reason}\n")
+def wait_for_pending_writes(pending_writes, keep=0, on_written=None):
+    """
+    Blocks until all but the newest `keep` queued image writes have finished.
+    `on_written` is called with the path of each successfully written image, in queue order.
+    """
+    while len(pending_writes) > keep:
+        future = pending_writes.pop(0)
+        try:
+            written_path = future.result()
+        except Exception as e:
+            logger.error(f"Error writing image: {e}")
+            continue
+        if written_path is not None and on_written is not None:
+            on_written(written_path)
 
-def create_zip_from_directory(directory_path_str, job_id):
-    """Creates a zip file from a directory, named with job_id."""
-    dir_path = Path(directory_path_str)
-    # place zip in a general downloads area, not inside the dir_path itself
+def create_output_folders(output_base_dir, category_names):
+    """
+    Creates the raw/realsense subfolders for every category once per job, so the per-frame path never calls mkdir.
+    Returns: dict {category_name: (raw_dir, realsense_dir)}
+    """
+    output_folders = {}
+    for name_folder in category_names:
+        target_dir_raw = Path(output_base_dir) / name_folder / "raw"
+        target_dir_realsense = Path(output_base_dir) / name_folder / "realsense"
+        target_dir_raw.mkdir(parents=True, exist_ok=True)
+        target_dir_realsense.mkdir(parents=True, exist_ok=True)
+        output_folders[name_folder] = (target_dir_raw, target_dir_realsense)
+    return output_folders
+
+def sort_into_folders(output_folders, name_folder, raw_image_cv, raw_image_name, realsense_image_cv, realsense_image_name, pending_writes=None):
+    """
+    Sorts images into the category subfolders created by create_output_folders.
+    Writes are queued on _io_pool; their futures are appended to `pending_writes` when given.
+    """
+    target_dir_raw, target_dir_realsense = output_folders[name_folder]
+
+    futures = [
+        _io_pool.submit(_write_image, str(target_dir_raw / raw_image_name), raw_image_cv),
+        _io_pool.submit(_write_image, str(target_dir_realsense / realsense_image_name), realsense_image_cv),
+    ]
+    if pending_writes is not None:
+        pending_writes.extend(futures)
+
+def open_removed_images_log(output_base_dir):
+    """Opens the removed-images log, line buffered so each rejection is written as it happens."""
+    log_file = open(Path(output_base_dir) / REMOVED_IMAGES_LOG_NAME, "w", buffering=1)
+    log_file.write("Log of images removed or not fitting criteria:\n")
+    return log_file
+
+def open_results_zip(job_id):
+    """Opens the results ZIP for a job, named with job_id. Returns (zipfile.ZipFile, zip_filename)."""
+    # place zip in a general downloads area, not inside the output dir itself
     zip_filename = f"Results_{job_id}.zip"
-    zip_path = Path("downloads") / zip_filename 
-    
     Path("downloads").mkdir(exist_ok=True)
+    return zipfile.ZipFile(Path("downloads") / zip_filename, 'w', zipfile.ZIP_DEFLATED), zip_filename
+
+def add_file_to_zip(zipf, file_path_str, base_dir):
+    """
+    Streams one file into an open ZIP under its path relative to base_dir.
+    ZipFile is not thread safe, so all calls for one ZIP must come from the same thread.
+    """
+    file_path = Path(file_path_str)
+    zip_info = zipfile.ZipInfo.from_file(file_path, file_path.relative_to(base_dir))
+    zip_info.compress_type = zipfile.ZIP_STORED if file_path.suffix.lower() in PRECOMPRESSED_SUFFIXES else zipfile.ZIP_DEFLATED
+    # Stream the file in fixed-size chunks instead of holding it in memory
+    with open(file_path, 'rb') as src, zipf.open(zip_info, 'w') as dst:
+        shutil.copyfileobj(src, dst, ZIP_COPY_CHUNK_SIZE)
+
+
+def open_video_capture(video_path):
+    """
+    Opens a video with the FFmpeg backend, asking for hardware-accelerated decoding (VAAPI, NVDEC, ...).
+    OpenCV decodes in software when no accelerator is available; any other backend is tried if FFmpeg can't open the file.
+    OpenCV before 4.5.2 has no hardware acceleration properties, so the video is opened plainly there.
+    """
+    if not hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        return cv2.VideoCapture(video_path)
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(video_path)
+    elif cap.get(cv2.CAP_PROP_HW_ACCELERATION) != cv2.VIDEO_ACCELERATION_NONE:
+        logger.info(f"Hardware-accelerated decoding enabled for {video_path}")
+    return cap
+
+def _put_unless_stopped(frame_queue, item, stop_event):
+    """Puts `item` on the queue, giving up if the consumer has stopped reading."""
+    while not stop_event.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
 
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(dir_path):
-            for file in files:
-                file_path = Path(root) / file
-                arcname = file_path.relative_to(dir_path)
-                zipf.write(file_path, arcname)
-    logger.info(f"ZIP file created at: {zip_path}")
-    return zip_filename # Return only the name for URL construction
+def _read_frames_into_queue(cap, frame_queue, stop_event):
+    """
+    Decodes frames from `cap` into `frame_queue`. The last item is always an end marker: None at the
+    end of the video, or the exception that stopped decoding, so the consumer never waits forever.
+    """
+    end_marker = None
+    try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret or not _put_unless_stopped(frame_queue, frame, stop_event):
+                break
+    except Exception as e:
+        end_marker = e
+    finally:
+        _put_unless_stopped(frame_queue, end_marker, stop_event)
 
 
 def load_and_process_frame_pair(
     raw_frame_cv, raw_frame_name, realsense_frame_cv, realsense_frame_name,
-    loaded_pattern_images_data, # List of (pattern_cv_gray, pattern_name)
-    output_base_dir_for_accepted,
+    realsense_gray_cv, # Grayscale RealSense frame used by every analysis stage
+    loaded_pattern_descriptors, # List of (pattern_descriptors, pattern_name)
+    output_folders, # {category_name: (raw_dir, realsense_dir)} from create_output_folders
     # Configurable parameters
     run_solid_color_check: bool,
     run_object_detection: bool,
@@ -203,7 +609,11 @@ def load_and_process_frame_pair(
     # Thresholds and prompts
     bw_filter_params: dict, # {'black_thresh', 'white_thresh', 'percentage_thresh'}
     obj_detect_prompt: str,
-    pattern_match_sift_distance_thresh: int
+    pattern_match_sift_distance_thresh: int,
+    llm_stride: int = 1, # Max frames per LLM call, see trackedObjectDetection
+    obj_detect_state: dict = None, # Tracker state carried across frames of one job
+    pattern_index: dict = None, # Combined pattern descriptor index from build_pattern_index
+    pending_writes: list = None # Collects futures of queued image writes
 ):
     """
     Processes a single pair of raw and realsense frames based on active pipeline stages.
@@ -211,7 +621,7 @@ def load_and_process_frame_pair(
     """
     # 1. Solid Color Check (on RealSense frame)
     if run_solid_color_check:
-        if is_mostly_black_or_white(realsense_frame_cv,
+        if is_mostly_black_or_white(realsense_gray_cv,
                                     bw_filter_params['black_thresh'],
                                     bw_filter_params['white_thresh'],
                                     bw_filter_params['percentage_thresh']):
@@ -220,7 +630,10 @@ def load_and_process_frame_pair(
 
     # 2. Model Object Detection (on Raw frame)
     if run_object_detection:
-        objects_detected, model_reason = modelObjectDetection(raw_frame_cv, obj_detect_prompt)
+        if obj_detect_state is None:
+            objects_detected, model_reason = modelObjectDetection(raw_frame_cv, obj_detect_prompt)
+        else:
+            objects_detected, model_reason = trackedObjectDetection(raw_frame_cv, obj_detect_prompt, obj_detect_state, llm_stride)
         if objects_detected: # True if man-made objects are detected
             logger.info(f"{raw_frame_name}: Rejected by object detection. Reason: {model_reason}")
             return False, f"Rejected: Man-made objects detected ({model_reason[:50]}...)"
@@ -228,11 +641,11 @@ def load_and_process_frame_pair(
     # 3. Pattern Matching (on RealSense frame)
     classification_name = "Uncategorized" # Default if pattern matching is off or no match
     if run_pattern_matching:
-        if not loaded_pattern_images_data:
+        if not loaded_pattern_descriptors:
             logger.warning(f"{realsense_frame_name}: Pattern matching is ON but no pattern images were loaded/provided.")
             classification_name = "No_Patterns_Available"
         else:
-            best_match_name = patternThresholding(realsense_frame_cv, loaded_pattern_images_data, pattern_match_sift_distance_thresh)
+            best_match_name = patternThresholding(realsense_gray_cv, loaded_pattern_descriptors, pattern_match_sift_distance_thresh, pattern_index)
             if best_match_name:
                 classification_name = best_match_name
                 logger.info(f"{realsense_frame_name}: Matched pattern '{best_match_name}'.")
@@ -244,7 +657,7 @@ def load_and_process_frame_pair(
                 # return False, "Rejected: No pattern match"
 
     # If all checks passed (or were skipped), sort the image
-    sort_into_folders(output_base_dir_for_accepted, classification_name, raw_frame_cv, raw_frame_name, realsense_frame_cv, realsense_frame_name)
+    sort_into_folders(output_folders, classification_name, raw_frame_cv, raw_frame_name, realsense_frame_cv, realsense_frame_name, pending_writes)
     return True, classification_name
 
 
@@ -262,6 +675,7 @@ def process_video_frames(
     Saves accepted images into categorized folders and creates a ZIP archive.
     Returns: (number_of_frames_processed, name_of_output_zip_file)
     """
+    log_opencv_cpu_features()
     logger.info(f"Job {job_id}: Starting video processing. Raw: '{path_to_raw_video}', RealSense: '{path_to_realsense_video}'")
     
     # Define base output directory for this job's accepted images
@@ -287,9 +701,15 @@ def process_video_frames(
                 img_path = Path(img_path_str)
                 pattern_cv_img = cv2.imread(str(img_path))
                 if pattern_cv_img is not None:
-                    # Convert to grayscale for SIFT consistency
+                    # Convert to grayscale for feature extraction
                     pattern_cv_gray = cv2.cvtColor(pattern_cv_img, cv2.COLOR_BGR2GRAY)
-                    loaded_patterns.append((pattern_cv_gray, img_path.name))
+                    # Patterns are fixed for the whole job, so compute their descriptors once here
+                    # (on the GPU path they stay on the device, so frames match against them without copies)
+                    pattern_descriptors = extract_descriptors(pattern_cv_gray)
+                    if pattern_descriptors is None:
+                        logger.warning(f"Job {job_id}: No descriptors found for pattern: {img_path.name}")
+                        continue
+                    loaded_patterns.append((pattern_descriptors, img_path.name))
                 else:
                     logger.warning(f"Job {job_id}: Could not load pattern image: {img_path_str}")
             except Exception as e:
@@ -298,20 +718,11 @@ def process_video_frames(
         logger.warning(f"Job {job_id}: Pattern Thresholding is ON, but no pattern image paths were provided.")
 
 
-    cap_raw = cv2.VideoCapture(path_to_raw_video)
-    cap_realsense = cv2.VideoCapture(path_to_realsense_video)
-
-    if not cap_raw.isOpened():
-        logger.error(f"Job {job_id}: Error: Unable to open raw video: {path_to_raw_video}")
-        raise IOError(f"Could not open raw video: {path_to_raw_video}")
-    if not cap_realsense.isOpened():
-        logger.error(f"Job {job_id}: Error: Unable to open RealSense video: {path_to_realsense_video}")
-        cap_raw.release() # Release the already opened one
-        raise IOError(f"Could not open RealSense video: {path_to_realsense_video}")
-
     frame_count = 0
     processed_frame_count = 0
-    removed_images_log_data = []
+    removed_count = 0
+    pending_writes = [] # Futures for accepted frames still being written by _io_pool
+    obj_detect_state = {} # Optical-flow tracker state for reusing LLM verdicts
 
     # Prepare parameters for load_and_process_frame_pair
     bw_params = {
@@ -322,53 +733,145 @@ def process_video_frames(
     obj_det_prompt = thres_params.get('Object Detection Prompt', "Analyze...")
     # This was THRESHOLD_PATTERN_MATCH, used as a distance.
     sift_distance_thresh = thres_params.get('Pattern Thresholding Value', 200)
+    if USE_CUDA and loaded_patterns:
+        logger.warning(f"Job {job_id}: Matching patterns with ORB on the GPU; 'Pattern Thresholding Value' "
+                       f"({sift_distance_thresh}) is ignored in favour of a Hamming distance of {ORB_HAMMING_THRESH}.")
+    llm_stride = int(thres_params.get('LLM Stride', 10))
+    frame_dedupe_thresh = thres_params.get('Frame Dedupe Threshold', 2.0) # 0 disables frame-diff gating
+    prev_thumbnail = None # Thumbnail and verdict of the last frame that went through every stage
+    prev_verdict = None
+
+    # Parameters, the pattern index and the output folders are all set up before the captures are opened,
+    # so an error in any of them can't leave the captures unreleased
+    # Pattern search structures are built once, so frames don't rebuild them per match
+    pattern_index = build_pattern_index(loaded_patterns)
+
+    # Every category a frame can be sorted into is known up front
+    category_names = {"Uncategorized", "No_Pattern_Match", "No_Patterns_Available"}
+    category_names.update(pattern_name for _, pattern_name in loaded_patterns)
+    output_folders = create_output_folders(output_base_dir, category_names)
+
+    cap_raw = open_video_capture(path_to_raw_video)
+    cap_realsense = open_video_capture(path_to_realsense_video)
 
+    if not cap_raw.isOpened():
+        logger.error(f"Job {job_id}: Error: Unable to open raw video: {path_to_raw_video}")
+        raise IOError(f"Could not open raw video: {path_to_raw_video}")
+    if not cap_realsense.isOpened():
+        logger.error(f"Job {job_id}: Error: Unable to open RealSense video: {path_to_realsense_video}")
+        cap_raw.release() # Release the already opened one
+        raise IOError(f"Could not open RealSense video: {path_to_realsense_video}")
 
-    while True:
-        ret_raw, raw_frame = cap_raw.read()
-        ret_realsense, realsense_frame = cap_realsense.read()
-
-        if not ret_raw or not ret_realsense:
-            logger.info(f"Job {job_id}: Reached end of one or both videos after {frame_count} iterations.")
-            break
 
-        raw_frame_name = f"raw_frame_{frame_count:05d}.png" # Save as png for quality
-        realsense_frame_name = f"realsense_frame_{frame_count:05d}.png"
+    # Rejections are logged as they happen, and accepted frames are added to the ZIP on a single
+    # background thread as soon as their writes finish, so little is left to do after the last frame.
+    # Both are opened inside the try below, so a failure while opening either one still closes the other
+    removed_log = None
+    results_zip = None
+    job_succeeded = False
+    zip_executor = ThreadPoolExecutor(max_workers=1)
+    zip_futures = []
+    def zip_written_file(path):
+        zip_futures.append(zip_executor.submit(add_file_to_zip, results_zip, path, output_base_dir))
+
+    # Producer threads decode both videos ahead of the processing loop
+    raw_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    realsense_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    stop_decoding = threading.Event()
+    decoder_threads = [
+        threading.Thread(target=_read_frames_into_queue, args=(cap_raw, raw_queue, stop_decoding), daemon=True),
+        threading.Thread(target=_read_frames_into_queue, args=(cap_realsense, realsense_queue, stop_decoding), daemon=True),
+    ]
+    for thread in decoder_threads:
+        thread.start()
 
-        accepted, reason_or_category = load_and_process_frame_pair(
-            raw_frame, raw_frame_name, realsense_frame, realsense_frame_name,
-            loaded_patterns,
-            output_base_dir, # Pass the specific output dir for accepted images
-            run_solid_color_check=pipeline_processes_config.get('Solid Color Detection', True),
-            run_object_detection=pipeline_processes_config.get('Model Object Detection', True),
-            run_pattern_matching=pipeline_processes_config.get('Pattern Thresholding', True),
-            bw_filter_params=bw_params,
-            obj_detect_prompt=obj_det_prompt,
-            pattern_match_sift_distance_thresh=sift_distance_thresh
-        )
+    try:
+        removed_log = open_removed_images_log(output_base_dir)
+        results_zip, zip_file_name = open_results_zip(job_id)
+
+        while True:
+            raw_frame = raw_queue.get()
+            realsense_frame = realsense_queue.get()
+            for frame in (raw_frame, realsense_frame):
+                if isinstance(frame, Exception):
+                    raise IOError(f"Video decoding failed: {frame}") from frame
+
+            if raw_frame is None or realsense_frame is None:
+                logger.info(f"Job {job_id}: Reached end of one or both videos after {frame_count} iterations.")
+                break
+
+            # Converted once here; the color frame is only kept for the disk write
+            realsense_gray = cv2.cvtColor(realsense_frame, cv2.COLOR_BGR2GRAY)
+
+            raw_frame_name = f"raw_frame_{frame_count:05d}.jpg"
+            realsense_frame_name = f"realsense_frame_{frame_count:05d}.jpg"
+
+            thumbnail = frame_thumbnail(realsense_gray)
+            if (prev_verdict is not None and frame_dedupe_thresh > 0
+                    and thumbnail_difference(thumbnail, prev_thumbnail) < frame_dedupe_thresh):
+                # Static scene: reuse the last analysed frame's verdict instead of running every stage again
+                accepted, reason_or_category = prev_verdict
+                if accepted:
+                    sort_into_folders(output_folders, reason_or_category, raw_frame, raw_frame_name, realsense_frame, realsense_frame_name, pending_writes)
+            else:
+                accepted, reason_or_category = load_and_process_frame_pair(
+                    raw_frame, raw_frame_name, realsense_frame, realsense_frame_name,
+                    realsense_gray,
+                    loaded_patterns,
+                    output_folders, # Pass the specific output folders for accepted images
+                    run_solid_color_check=pipeline_processes_config.get('Solid Color Detection', True),
+                    run_object_detection=pipeline_processes_config.get('Model Object Detection', True),
+                    run_pattern_matching=pipeline_processes_config.get('Pattern Thresholding', True),
+                    bw_filter_params=bw_params,
+                    obj_detect_prompt=obj_det_prompt,
+                    pattern_match_sift_distance_thresh=sift_distance_thresh,
+                    llm_stride=llm_stride,
+                    obj_detect_state=obj_detect_state,
+                    pattern_index=pattern_index,
+                    pending_writes=pending_writes
+                )
+                # A verdict from a failed model call is this frame's safe default only, never reused
+                if obj_detect_state.pop('model_failed', False):
+                    prev_thumbnail, prev_verdict = None, None
+                else:
+                    prev_thumbnail, prev_verdict = thumbnail, (accepted, reason_or_category)
+            # Keep memory bounded if writing falls behind processing
+            wait_for_pending_writes(pending_writes, keep=MAX_PENDING_WRITES, on_written=zip_written_file)
 
-        if not accepted:
-            removed_images_log_data.append((raw_frame_name, reason_or_category))
+            if not accepted:
+                removed_log.write(f"Frame/Image name: {raw_frame_name}, Reason: {reason_or_category}\n")
+                removed_count += 1
         
-        processed_frame_count +=1
-        if frame_count % 100 == 0: # Log progress
-            logger.info(f"Job {job_id}: Processed {frame_count} frame pairs...")
-        frame_count +=1
-
-
-    cap_raw.release()
-    cap_realsense.release()
-    logger.info(f"Job {job_id}: Finished processing video frames. Total pairs iterated: {frame_count}, successfully processed: {processed_frame_count - len(removed_images_log_data)}")
-
-    create_text_file_with_removed_images(output_base_dir, removed_images_log_data)
-    
-    # Zip the contents of output_base_dir
-    if os.listdir(output_base_dir): # Only zip if there's content
-        zip_file_name = create_zip_from_directory(str(output_base_dir), job_id)
+            processed_frame_count +=1
+            if frame_count % 100 == 0: # Log progress
+                logger.info(f"Job {job_id}: Processed {frame_count} frame pairs...")
+            frame_count +=1
+
+        wait_for_pending_writes(pending_writes, on_written=zip_written_file) # All frames must be on disk before zipping
+        logger.info(f"Job {job_id}: Finished processing video frames. Total pairs iterated: {frame_count}, successfully processed: {processed_frame_count - removed_count}")
+
+        removed_log.close()
+        zip_written_file(str(Path(output_base_dir) / REMOVED_IMAGES_LOG_NAME))
+        for future in zip_futures:
+            future.result() # Surface any error from adding a file to the ZIP
+        job_succeeded = True
         logger.info(f"Job {job_id}: Successfully created ZIP file: {zip_file_name}")
-    else:
-        logger.info(f"Job {job_id}: No images were accepted. ZIP file not created.")
-        zip_file_name = None # Or an empty zip, depending on requirements
+    finally:
+        # Captures can only be released once the decoder threads are done with them
+        stop_decoding.set()
+        for thread in decoder_threads:
+            thread.join()
+        cap_raw.release()
+        cap_realsense.release()
+        if removed_log is not None:
+            removed_log.close()
+        zip_executor.shutdown(wait=True)
+        if results_zip is not None:
+            results_zip.close()
+            # The downloads folder is served as-is, so a failed job must not leave a partial archive there
+            if not job_succeeded:
+                Path(results_zip.filename).unlink(missing_ok=True)
+                logger.info(f"Job {job_id}: Removed partial ZIP file after failure: {zip_file_name}")
 
     # Optionally, clean up the unzipped output_base_dir after zipping
     # shutil.rmtree(output_base_dir)